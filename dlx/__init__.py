@@ -1,2 +1,3 @@
 from .alg_x import AlgorithmX
+from .dlarrays import DancingLinksArrays
 from .dlmatrix import DancingLinksMatrix
@@ -3,121 +3,464 @@
 See http://arxiv.org/abs/cs/0011047.
 """
 
+import gc
+import multiprocessing
 import string
-from collections import abc
-from collections.abc import Callable
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.queues import Queue
+from queue import Empty
 
-from .dlmatrix import Cell, DancingLinksMatrix, iterate_cell
+import numpy as np
+
+from .dlarrays import HAS_NUMBA, DancingLinksArrays
+from .dlmatrix import Cell, DancingLinksMatrix, HeaderCell, from_dense
 
 __author__ = "Davide Canton"
 
+# matrices with at most this many rows are searched with bitsets, see _search_bitsets
+BITSET_MAX_ROWS = 1024
+
+# the problem searched by a worker process of a parallel search, a DancingLinksArrays or the
+# bitsets of _search_bitsets; the flag that stops it, shared with the parent process, and
+# the queue of its solutions. They are set by _init_worker
+_worker_problem: DancingLinksArrays | tuple | None = None
+_worker_stop: Sequence[int] | None = None
+_worker_queue: Queue | None = None
+# the most solutions a worker sends at once
+_MAX_BATCH = 1024
+# seconds between the checks for failed branches while waiting for solutions
+_POLL_INTERVAL = 0.1
+
+
+class AlgorithmX:
+    """Callable object implementing the Algorithm X.
 
-class AlgorithmX(abc.Callable):
-    """Callable object implementing the Algorithm X."""
+    When the column with the minimum number of 1s is chosen and Numba is installed, the search
+    runs on a ``DancingLinksArrays`` copy of the matrix, in the compiled kernels of
+    ``dlx.dlarrays``; the Python callback is called only on the solutions. Without Numba,
+    matrices with at most ``BITSET_MAX_ROWS`` rows are searched on bitsets instead.
+    """
 
-    sol_dict: dict[int, Cell]
+    sol_stack: list[Cell | None]
     stop: bool
-    matrix: DancingLinksMatrix
-    callback: Callable[[dict[int, list[str]]], bool]
+    matrix: DancingLinksMatrix | DancingLinksArrays
+    callback: Callable[[list[int]], bool]
     choose_min: bool
+    processes: int
 
     def __init__(
         self,
-        matrix: DancingLinksMatrix,
-        callback: Callable[[dict[int, list[str]]], bool],
+        matrix: DancingLinksMatrix | DancingLinksArrays,
+        callback: Callable[[list[int]], bool],
         choose_min=True,
+        processes: int = 0,
     ):
         """Creates an Algorithm_X object that solves the problem encoded in matrix.
 
         Args:
-            matrix (DancingLinksMatrix): The ``DancingLinksMatrix`` instance.
+            matrix (DancingLinksMatrix | DancingLinksArrays): The matrix. A
+            ``DancingLinksArrays`` is always searched with the array kernels, compiled or not.
 
             callback (Callable): The callback called on every solution. callback has to
-            be a function receiving a dict argument ``{row_index: linked list of the row}``,
+            be a function receiving the list of the indexes of the rows in the solution,
             and can return a ``bool`` value. The solver keeps going on until the callback returns
-            ``True``.
+            ``True``. Use ``DancingLinksMatrix.decode_solution`` to get the column names.
 
             choose_min (bool): If ``True``, the column with the minimum number of 1s is
-            chosen at each iteration, if ``False`` a random column is chosen.
+            chosen at each iteration, if ``False`` a random column is chosen. Random choice
+            is available only on ``DancingLinksMatrix``.
+
+            processes (int): If not 0, the rows of the first chosen column are searched in
+            parallel by this many worker processes, each on its own copy of the matrix: a
+            ``DancingLinksArrays`` when the serial search would use one, else the bitsets.
+            The callback is still called in this process, as the solutions arrive, in no
+            particular order. When it stops the search, the workers stop at their next step.
+
+        Raises:
+            ValueError: if ``choose_min`` is ``False`` with a ``DancingLinksArrays`` matrix or
+            with a parallel search, or if a parallel search of a ``DancingLinksMatrix`` with
+            more than ``BITSET_MAX_ROWS`` rows is requested without Numba.
         """
-        self.sol_dict = {}
+        if not choose_min and (processes or isinstance(matrix, DancingLinksArrays)):
+            raise ValueError("random column choice needs a serial search on a DancingLinksMatrix")
+        if processes and not _searches_arrays(matrix) and matrix.rows > BITSET_MAX_ROWS:
+            raise ValueError(
+                f"a parallel search of more than {BITSET_MAX_ROWS} rows needs Numba, "
+                "or a DancingLinksArrays matrix"
+            )
+        # every level of the search covers at least a column, so the search is at
+        # most matrix.cols levels deep
+        self.sol_stack = [None] * matrix.cols
         self.stop = False
         self.matrix = matrix
         self.callback = callback
         self.choose_min = choose_min
+        self.processes = processes
 
     def __call__(self):
-        """Starts the search."""
-        self._search(0)
+        """Starts the search.
 
-    def _search(self, k: int):
-        # print(f"Size: {k}")
-        # print(f"Solution: {self.sol_dict}")
-        # print("Matrix:")
-        # print(self.matrix)
-
-        if self.matrix.header.R == self.matrix.header:
-            # matrix is empty, solution found
-            if self.callback(self._create_sol(k)):
-                self.stop = True
+        The cyclic garbage collector is disabled during the linked search on the cells only:
+        the cells form reference cycles by construction, and the search would otherwise keep
+        traversing them. The array, bitset and parallel searches leave it as it is.
+        """
+        if self.processes:
+            self._search_parallel()
+            return
+        if self.choose_min and _searches_arrays(self.matrix):
+            self._search_arrays()
+            return
+        if self.choose_min and self.matrix.rows <= BITSET_MAX_ROWS:
+            self._search_bitsets()
             return
 
-        if self.choose_min:
-            col = self.matrix.min_column()
-        else:
-            col = self.matrix.random_column()
-
-        # cover column col
-        self.matrix.cover(col)
-        row = col.D
-
-        for row in iterate_cell(col, "D"):
-            self.sol_dict[k] = row
-
-            # cover the columns pointed by the 1s in the chosen row
-            for j in iterate_cell(row, "R"):
-                self.matrix.cover(j.C)
-
-            self._search(k + 1)
-            if self.stop:
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._search()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _search(self):
+        # iterative version of the recursive search, so that deep searches do not
+        # pay a Python frame per level (nor hit the recursion limit).
+        # cols[k] is the column chosen at level k, sol_stack[k] the row currently
+        # tried for it (the column header itself before the first row).
+        matrix = self.matrix
+        callback = self.callback
+        header = matrix.header
+        cover = matrix.cover
+        uncover = matrix.uncover
+        choose_column = matrix.min_column if self.choose_min else matrix.random_column
+        sol_stack = self.sol_stack
+        cols: list[HeaderCell] = []
+        # the columns covered by choosing a row, in cover order, keyed by the
+        # row cell in the chosen column
+        row_cols: dict[Cell, tuple[HeaderCell, ...]] = {}
+
+        while True:
+            if header.R is header:
+                # matrix is empty, solution found
+                if callback(self._create_sol(len(cols))):
+                    self.stop = True
+                    return
+            else:
+                col = choose_column()
+                cover(col)
+                sol_stack[len(cols)] = col
+                cols.append(col)
+
+            # move to the next row of the deepest column, backtracking from the
+            # columns that have no rows left
+            while cols:
+                k = len(cols) - 1
+                col = cols[k]
+                row = sol_stack[k]
+
+                if row is not col:
+                    # uncover the columns covered by the previous row
+                    for c in reversed(row_cols[row]):
+                        uncover(c)
+
+                row = row.D
+                if row is not col:
+                    sol_stack[k] = row
+                    # cover the columns pointed by the 1s in the chosen row
+                    covered = row_cols.get(row)
+                    if covered is None:
+                        covered = []
+                        j = row.R
+                        while j is not row:
+                            covered.append(j.C)
+                            j = j.R
+                        covered = row_cols[row] = tuple(covered)
+                    for c in covered:
+                        cover(c)
+                    break
+
+                uncover(col)
+                cols.pop()
+            else:
                 return
 
-            # uncover columns
-            row = self.sol_dict[k]
-            col = row.C
-
-            for j in iterate_cell(row, "L"):
-                self.matrix.uncover(j.C)
-
-        self.matrix.uncover(col)
+    def _search_arrays(self):
+        arrays = self.matrix
+        callback = self.callback
+        if not isinstance(arrays, DancingLinksArrays):
+            # the search leaves covered columns behind if stopped, so it works on a copy
+            arrays = DancingLinksArrays.from_matrix(arrays)
+        for sol in arrays.solutions():
+            if callback(sol.tolist()):
+                self.stop = True
+                return
 
-    def _create_sol(self, k: int) -> dict[int, list[str]]:
-        # creates a solution from the inner dict
-        sol = {}
-        for key, row in self.sol_dict.items():
-            if key >= k:
-                continue
+    def _search_parallel(self):
+        matrix = self.matrix
+        if _searches_arrays(matrix):
+            problem = matrix
+            if not isinstance(problem, DancingLinksArrays):
+                problem = DancingLinksArrays.from_matrix(matrix)
+            if problem.R[0] == 0:
+                # matrix is empty, solution found
+                self.stop = bool(self.callback([]))
+                return
+            col = int(problem.min_column())
+            branches = []
+            row = problem.D[col]
+            while row != col:
+                branches.append((_search_branch_arrays, col, int(row)))
+                row = problem.D[row]
+        else:
+            row_cols, col_rows, active_cols = matrix.bitsets()
+            if not active_cols:
+                # matrix is empty, solution found
+                self.stop = bool(self.callback([]))
+                return
+            conflicts = _conflicts(row_cols, col_rows)
+            problem = (row_cols, col_rows, conflicts, active_cols)
+            candidates = _min_column_rows(col_rows, active_cols, (1 << len(row_cols)) - 1)
+            branches = [(_search_branch_bitsets, r) for r in _bits(candidates)]
+
+        # the workers send their solutions on the queue as they find them, and stop when
+        # the flag is set
+        stop = multiprocessing.RawArray("b", 1)
+        queue = multiprocessing.Queue()
+        pool = ProcessPoolExecutor(
+            self.processes, initializer=_init_worker, initargs=(problem, stop, queue)
+        )
+        callback = self.callback
+        try:
+            futures = [pool.submit(*branch) for branch in branches]
+            running = len(futures)
+            while running:
+                try:
+                    sols = queue.get(timeout=_POLL_INTERVAL)
+                except Empty:
+                    # a dead worker sends nothing more, raise its error
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            future.result()
+                    continue
+                if sols is None:
+                    # a branch is over
+                    running -= 1
+                    continue
+                for sol in sols:
+                    if callback(sol):
+                        self.stop = True
+                        return
+            # raise the error of a failed branch, if any
+            for future in futures:
+                future.result()
+        finally:
+            stop[0] = 1
+            # the workers still running stop at their next step, nobody waits for them
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _search_bitsets(self):
+        row_cols, col_rows, active_cols = self.matrix.bitsets()
+        callback = self.callback
+        conflicts = _conflicts(row_cols, col_rows)
+        active_rows = (1 << len(row_cols)) - 1
+        for sol in _bitset_solutions(row_cols, col_rows, conflicts, active_cols, active_rows):
+            if callback(sol):
+                self.stop = True
+                return
 
-            tmp_list = [row.C.name]
-            tmp_list.extend(r.C.name for r in iterate_cell(row, "R"))
-            sol[row.indexes[0]] = tmp_list
+    def _create_sol(self, k: int) -> list[int]:
+        # creates a solution from the row stack, column names are resolved only on request
+        return [row.row_idx for row in self.sol_stack[:k]]
+
+
+def _searches_arrays(matrix: DancingLinksMatrix | DancingLinksArrays) -> bool:
+    # True if the matrix is searched with the array kernels, when choosing the minimum column
+    return HAS_NUMBA or isinstance(matrix, DancingLinksArrays)
+
+
+def _bits(mask: int) -> Iterator[int]:
+    # yields the indexes of the bits set in mask, from the lowest
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _conflicts(row_cols: list[int], col_rows: list[int]) -> list[int]:
+    # the rows sharing at least a column with every row, the row included
+    conflicts = []
+    for mask in row_cols:
+        rows = 0
+        while mask:
+            low = mask & -mask
+            rows |= col_rows[low.bit_length() - 1]
+            mask ^= low
+        conflicts.append(rows)
+    return conflicts
+
+
+def _min_column_rows(col_rows: list[int], active_cols: int, active_rows: int) -> int:
+    # the compatible rows of the column with the fewest of them, stopping early on a dead end
+    # or a forced choice
+    best = -1
+    mask = active_cols
+    while mask:
+        low = mask & -mask
+        mask ^= low
+        rows = col_rows[low.bit_length() - 1] & active_rows
+        size = rows.bit_count()
+        if best < 0 or size < best:
+            best = size
+            candidates = rows
+            if size <= 1:
+                break
+    return candidates
+
+
+def _bitset_solutions(
+    row_cols: list[int],
+    col_rows: list[int],
+    conflicts: list[int],
+    active_cols: int,
+    active_rows: int,
+    stop: Sequence[int] | None = None,
+) -> Iterator[list[int]]:
+    # the state of the search is a pair of bitsets, the uncovered primary columns and
+    # the rows that are still compatible with the partial solution. Choosing a row
+    # clears its columns and the rows sharing a column with it, with no undo needed,
+    # and the size of a column is the popcount of its compatible rows.
+    # Every word operation here replaces a whole column walk of the linked search,
+    # but it costs O(rows / 64), hence the limit on the rows.
+    # The search ends early once stop[0] is not 0
+    sol: list[int] = []
+    # one [active_cols, active_rows, rows left to try] per level, as in sol
+    stack: list[list[int]] = []
+
+    while True:
+        if stop is not None and stop[0]:
+            return
+        if active_cols:
+            # _min_column_rows, inlined: this is the hottest loop of the search
+            best = -1
+            mask = active_cols
+            while mask:
+                low = mask & -mask
+                mask ^= low
+                rows = col_rows[low.bit_length() - 1] & active_rows
+                size = rows.bit_count()
+                if best < 0 or size < best:
+                    best = size
+                    candidates = rows
+                    if size <= 1:
+                        break
+            stack.append([active_cols, active_rows, candidates])
+            sol.append(-1)
+        else:
+            # matrix is empty, solution found
+            yield sol.copy()
+
+        # move to the next row of the deepest level, backtracking from the
+        # levels that have no rows left
+        while stack:
+            level = stack[-1]
+            candidates = level[2]
+            if candidates:
+                low = candidates & -candidates
+                level[2] = candidates ^ low
+                r = low.bit_length() - 1
+                sol[-1] = r
+                active_cols = level[0] & ~row_cols[r]
+                active_rows = level[1] & ~conflicts[r]
+                break
+            stack.pop()
+            sol.pop()
+        else:
+            return
 
-        return sol
 
+def _init_worker(problem: DancingLinksArrays | tuple, stop: Sequence[int], queue: Queue):
+    global _worker_problem, _worker_stop, _worker_queue
+    _worker_problem = problem
+    _worker_stop = stop
+    _worker_queue = queue
+    # the parent stops reading when the search is stopped, so the worker must not wait
+    # at exit for its pending solutions to be read
+    queue.cancel_join_thread()
+
+
+def _send_solutions(sols: Iterator[list[int]], first: list[int]):
+    # sends on the queue the solutions, each one after the rows in first, in batches of
+    # growing size so that the first one is sent at once
+    stop = _worker_stop
+    queue = _worker_queue
+    batch = []
+    size = 1
+    for sol in sols:
+        batch.append(first + sol)
+        if len(batch) == size:
+            if stop[0]:
+                return
+            queue.put(batch)
+            batch = []
+            size = min(2 * size, _MAX_BATCH)
+    if batch and not stop[0]:
+        queue.put(batch)
+
+
+def _search_branch_arrays(col: int, row: int):
+    # sends the solutions that contain the row of the node row, chosen for the column col,
+    # and then None. The matrix of the worker is restored afterwards, for its next branch,
+    # unless the search is stopped: then no branch uses it anymore
+    arrays = _worker_problem
+    stop = _worker_stop
+    try:
+        if stop[0]:
+            return
+        arrays.cover(col)
+        j = arrays.R[row]
+        while j != row:
+            arrays.cover(arrays.C[j])
+            j = arrays.R[j]
+
+        # the kernels check the flag at every step
+        sols = arrays.solutions(np.frombuffer(stop, dtype=np.int8))
+        _send_solutions((sol.tolist() for sol in sols), [int(arrays.row[row])])
+        if stop[0]:
+            return
 
-def _from_dense(row):
-    return [i for i, el in enumerate(row) if el]
+        j = arrays.L[row]
+        while j != row:
+            arrays.uncover(arrays.C[j])
+            j = arrays.L[j]
+        arrays.uncover(col)
+    finally:
+        _worker_queue.put(None)
+
+
+def _search_branch_bitsets(r: int):
+    # sends the solutions that contain the row r, and then None
+    row_cols, col_rows, conflicts, active_cols = _worker_problem
+    stop = _worker_stop
+    try:
+        active_rows = ((1 << len(row_cols)) - 1) & ~conflicts[r]
+        sols = _bitset_solutions(
+            row_cols, col_rows, conflicts, active_cols & ~row_cols[r], active_rows, stop
+        )
+        _send_solutions(sols, [r])
+    finally:
+        _worker_queue.put(None)
 
 
 def main():
     """Main."""
     rows = [
-        _from_dense([0, 0, 1, 0, 1, 1, 0]),
-        _from_dense([1, 0, 0, 1, 0, 0, 1]),
-        _from_dense([0, 1, 1, 0, 0, 1, 0]),
-        _from_dense([1, 0, 0, 1, 0, 0, 0]),
-        _from_dense([0, 1, 0, 0, 0, 0, 1]),
-        _from_dense([0, 0, 0, 1, 1, 0, 1]),
+        from_dense([0, 0, 1, 0, 1, 1, 0]),
+        from_dense([1, 0, 0, 1, 0, 0, 1]),
+        from_dense([0, 1, 1, 0, 0, 1, 0]),
+        from_dense([1, 0, 0, 1, 0, 0, 0]),
+        from_dense([0, 1, 0, 0, 0, 0, 1]),
+        from_dense([0, 0, 0, 1, 1, 0, 1]),
     ]
 
     size = max(max(rows, key=max)) + 1
@@ -129,7 +472,7 @@ def main():
 
     # print(d)
 
-    AlgorithmX(d, print)()
+    AlgorithmX(d, lambda sol: print(d.decode_solution(sol)))()
 
 
 if __name__ == "__main__":
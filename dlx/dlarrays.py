@@ -0,0 +1,545 @@
+"""Struct-of-arrays layout of a Dancing Links matrix.
+
+Every node of the matrix is an index into parallel ``int32`` arrays, one per link, as in the
+array-based implementation of Knuth's Algorithm X (TAOCP 7.2.2.1). Node 0 is the root, nodes
+``1..cols`` are the column headers (column ``i`` is node ``i + 1``) and the 1s follow, sorted
+by row and then by column.
+
+The module-level functions work only on the arrays, so they are compiled to native code with
+Numba when it is installed, and run as plain Python otherwise.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator, Sequence
+
+import numpy as np
+
+from .dlmatrix import (
+    Cell,
+    DancingLinksMatrix,
+    EmptyDLMatrix,
+    HeaderCell,
+    flatten_rows,
+    parse_columns,
+)
+
+try:
+    from numba import njit
+
+    HAS_NUMBA = True
+except ImportError:  # numba is optional
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """Fallback for ``numba.njit`` that leaves the function as it is."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda f: f
+
+
+__author__ = "Davide Canton"
+
+# added to the size of the columns that cannot be chosen, so that the minimum of S is always
+# the size of an uncovered primary column, if there is one
+INACTIVE = 1 << 29
+
+
+class DancingLinksArrays:
+    """Dancing Links matrix stored as parallel arrays of node indexes.
+
+    ``U``, ``D``, ``L``, ``R`` are the links of every node, ``C`` the column header of every
+    node, ``row`` the row index of every 1 (-1 for the headers). ``S`` stores the column sizes
+    and is indexed by header node; ``INACTIVE`` is added to the root, to the secondary columns
+    and to the covered columns.
+
+    ``trail`` records the nodes unlinked by every ``cover``, followed by their number, up to
+    ``top``: ``uncover`` relinks them by reading the trail backwards instead of walking the
+    rows of the column again, so the columns must be uncovered in reverse cover order.
+    """
+
+    U: np.ndarray
+    D: np.ndarray
+    L: np.ndarray
+    R: np.ndarray
+    C: np.ndarray
+    S: np.ndarray
+    row: np.ndarray
+    names: list[str | None]
+    rows: int
+    cols: int
+    nodes: int
+    trail: np.ndarray
+    top: int
+
+    def __init__(self, columns: int | Iterable[str | tuple[str, bool]], capacity: int = 0):
+        """Creates a matrix with no rows.
+
+        Args:
+            columns (int | Iterable[str | tuple[str, bool]]): The columns, as in
+                ``DancingLinksMatrix``.
+            capacity (int): The number of 1s to allocate room for. The arrays grow as needed
+                when rows are added, so it is only a hint.
+        """
+        columns = list(parse_columns(columns))
+        self.names = [name for name, _ in columns]
+        self.rows = 0
+        self.cols = len(columns)
+        self.nodes = self.cols + 1
+        self.S = np.full(self.cols + 1, INACTIVE, dtype=np.int32)
+        self.trail = np.empty(0, dtype=np.int32)
+        self.top = 0
+        self._allocate(self.nodes + capacity)
+
+        # only the primary columns are linked to the root
+        prev = 0
+        for c, (_, primary) in enumerate(columns, start=1):
+            if primary:
+                self.R[prev] = c
+                self.L[c] = prev
+                self.S[c] = 0
+                prev = c
+        self.R[prev] = 0
+        self.L[0] = prev
+
+    def _allocate(self, n_nodes: int) -> None:
+        """Allocates the arrays for ``n_nodes`` nodes, with every node linked to itself."""
+        nodes = np.arange(n_nodes, dtype=np.int32)
+        self.U, self.D, self.L, self.R, self.C = (nodes.copy() for _ in range(5))
+        self.row = np.full(n_nodes, -1, dtype=np.int32)
+
+    def _reserve(self, n: int) -> None:
+        """Grows the arrays, if needed, so that ``n`` more nodes can be added."""
+        size = len(self.row)
+        if self.nodes + n <= size:
+            return
+        size = max(2 * size, self.nodes + n)
+        self.U, self.D, self.L, self.R, self.C, self.row = (
+            np.concatenate((a[: self.nodes], np.full(size - self.nodes, fill, dtype=np.int32)))
+            for a, fill in (
+                (self.U, 0),
+                (self.D, 0),
+                (self.L, 0),
+                (self.R, 0),
+                (self.C, 0),
+                (self.row, -1),
+            )
+        )
+
+    def _reserve_trail(self) -> None:
+        """Grows the trail, if needed, so that every node can be on it at the same time."""
+        # a node is unlinked at most once until it is relinked, and every covered
+        # column adds its entry count
+        size = self.nodes + self.cols
+        if len(self.trail) < size:
+            trail = np.empty(size, dtype=np.int32)
+            trail[: self.top] = self.trail[: self.top]
+            self.trail = trail
+
+    @classmethod
+    def from_matrix(cls, matrix: DancingLinksMatrix, release: bool = False) -> DancingLinksArrays:
+        """Converts a ``DancingLinksMatrix`` to the array layout.
+
+        The matrix must not have covered columns. Only the nodes connected to the root are
+        converted: the others (secondary columns with no 1s) can never be part of a solution,
+        and their name is ``None``.
+
+        Args:
+            matrix (DancingLinksMatrix): The matrix to convert.
+            release (bool): If True, the cells of the matrix are freed after the conversion,
+                with ``DancingLinksMatrix.release``, and the matrix cannot be used anymore.
+
+        Returns:
+            DancingLinksArrays: The converted matrix.
+        """
+        header = matrix.header
+        seen: dict[int, Cell] = {id(header): header}
+        stack: list[Cell] = [header]
+        while stack:
+            node = stack.pop()
+            for link in (node.U, node.D, node.L, node.R, node.C):
+                if link is not None and id(link) not in seen:
+                    seen[id(link)] = link
+                    stack.append(link)
+        del seen[id(header)]
+
+        headers = [node for node in seen.values() if isinstance(node, HeaderCell)]
+        cells = sorted(
+            (node for node in seen.values() if not isinstance(node, HeaderCell)),
+            key=lambda cell: (cell.row_idx, cell.col_idx),
+        )
+
+        ids = {id(header): 0}
+        ids.update((id(col), col.col_idx + 1) for col in headers)
+        first_cell = matrix.cols + 1
+        ids.update((id(cell), n) for n, cell in enumerate(cells, start=first_cell))
+
+        arrays = cls(matrix.cols)
+        arrays.names = [None] * matrix.cols
+        for col in headers:
+            arrays.names[col.col_idx] = col.name
+        arrays.rows = matrix.rows
+        arrays.nodes = first_cell + len(cells)
+        arrays._allocate(arrays.nodes)
+
+        for node in (header, *headers, *cells):
+            n = ids[id(node)]
+            arrays.U[n] = ids[id(node.U)]
+            arrays.D[n] = ids[id(node.D)]
+            arrays.L[n] = ids[id(node.L)]
+            arrays.R[n] = ids[id(node.R)]
+        arrays.S[:] = INACTIVE
+        for col in headers:
+            arrays.S[col.col_idx + 1] += col.size - (INACTIVE if col.primary else 0)
+        arrays.C[first_cell:] = [ids[id(cell.C)] for cell in cells]
+        arrays.row[first_cell:] = [cell.row_idx for cell in cells]
+        if release:
+            del seen, headers, cells
+            matrix.release()
+        return arrays
+
+    def add_sparse_row(self, row: Iterable[int], already_sorted: bool = False) -> None:
+        """Adds a row to the matrix, given the indexes of its 1s.
+
+        The new nodes are appended after the existing ones, so the nodes of every row are
+        contiguous and the column lists stay sorted by row.
+
+        Args:
+            row (Iterable[int]): The indexes of the columns with a 1 in the row.
+            already_sorted (bool): True if the indexes are already sorted.
+        """
+        row = list(row) if already_sorted else sorted(row)
+        n = len(row)
+        self._reserve(n)
+        U, D, L, R, C, S = self.U, self.D, self.L, self.R, self.C, self.S
+        first = self.nodes
+        last = first + n - 1
+
+        x = first
+        for col in row:
+            c = col + 1
+            up = U[c]
+            D[up] = x
+            U[x] = up
+            D[x] = c
+            U[c] = x
+            C[x] = c
+            S[c] += 1
+            L[x] = x - 1 if x > first else last
+            R[x] = x + 1 if x < last else first
+            x += 1
+
+        self.row[first : last + 1] = self.rows
+        self.nodes += n
+        self.rows += 1
+
+    def add_sparse_rows(
+        self, rows: np.ndarray | Sequence[Sequence[int]], already_sorted: bool = False
+    ) -> None:
+        """Adds several rows to the matrix, linking all their nodes with array operations.
+
+        It is equivalent to calling ``add_sparse_row`` on every row.
+
+        Args:
+            rows (np.ndarray | Sequence[Sequence[int]]): The rows, as a 2-D array with one row
+                per line, or as a sequence of rows of any length.
+            already_sorted (bool): True if the indexes of every row are already sorted.
+
+        Raises:
+            ValueError: if ``rows`` is not a sequence of rows, or a row is empty.
+        """
+        cols, lengths = flatten_rows(rows)
+        n = len(cols)
+        if n == 0:
+            return
+        row_ids = np.repeat(np.arange(len(lengths)), lengths)
+        if not already_sorted:
+            cols = cols[np.lexsort((cols, row_ids))]
+
+        self._reserve(n)
+        first = self.nodes
+        nodes = np.arange(first, first + n, dtype=np.int32)
+        heads = (cols + 1).astype(np.int32)
+        new = slice(first, first + n)
+        self.C[new] = heads
+        self.row[new] = self.rows + row_ids
+
+        # horizontal links: the last node of every row points back to the first one
+        starts = np.cumsum(lengths) - lengths
+        ends = starts + lengths - 1
+        starts, ends = starts[lengths > 0], ends[lengths > 0]
+        right = nodes + 1
+        right[ends] = nodes[starts]
+        left = nodes - 1
+        left[starts] = nodes[ends]
+        self.R[new] = right
+        self.L[new] = left
+
+        # vertical links: the new nodes of every column, in row order, are appended
+        # after the last node of the column
+        order = np.argsort(heads, kind="stable")
+        col_nodes, col_heads = nodes[order], heads[order]
+        group_starts = np.flatnonzero(np.diff(col_heads, prepend=-1))
+        group_ends = np.append(group_starts[1:], n) - 1
+        group_heads = col_heads[group_starts]
+        old_last = self.U[group_heads]
+        up = np.roll(col_nodes, 1)
+        up[group_starts] = old_last
+        down = np.roll(col_nodes, -1)
+        down[group_ends] = group_heads
+        self.U[col_nodes] = up
+        self.D[col_nodes] = down
+        self.D[old_last] = col_nodes[group_starts]
+        self.U[group_heads] = col_nodes[group_ends]
+        self.S += np.bincount(heads, minlength=self.cols + 1).astype(np.int32)
+
+        self.nodes += n
+        self.rows += len(lengths)
+
+    def end_add(self) -> None:
+        """Called when there are no more rows to be inserted.
+
+        Not strictly necessary: it trims the arrays to the nodes in use, freeing the room
+        reserved for more rows.
+        """
+        n = self.nodes
+        self.U, self.D, self.L, self.R, self.C, self.row = (
+            a[:n].copy() for a in (self.U, self.D, self.L, self.R, self.C, self.row)
+        )
+
+    def cover(self, c: int) -> None:
+        """Covers the column with header node ``c``."""
+        self._reserve_trail()
+        self.top = cover(self.U, self.D, self.L, self.R, self.C, self.S, c, self.trail, self.top)
+
+    def uncover(self, c: int) -> None:
+        """Uncovers the column with header node ``c``, which must be the last one covered."""
+        self.top = uncover(self.U, self.D, self.L, self.R, self.C, self.S, c, self.trail, self.top)
+
+    def min_column(self) -> int:
+        """Returns the header node of the column with the minimum number of 1s.
+
+        Raises:
+            EmptyDLMatrix: if the matrix is empty.
+        """
+        if self.R[0] == 0:
+            raise EmptyDLMatrix()
+        return min_column(self.R, self.S)
+
+    def solutions(self, stop: np.ndarray | None = None) -> Iterator[np.ndarray]:
+        """Yields the solutions of the exact cover problem, found by the Algorithm X.
+
+        The column with the minimum number of 1s is chosen at each step. The search itself runs
+        in ``search``, and the generator is resumed only once per solution.
+        If the generator is not exhausted the matrix is left with covered columns.
+
+        Args:
+            stop (np.ndarray | None): A flag checked by the search at every step, as a
+                one-item ``int8`` array, e.g. in memory shared with another process. Once it is
+                not 0 the generator ends, leaving the matrix with covered columns.
+
+        Yields:
+            np.ndarray: The indexes of the rows in the solution.
+        """
+        if stop is None:
+            stop = np.zeros(1, dtype=np.int8)
+        # every level of the search covers at least a column
+        cols = np.empty(self.cols, dtype=np.int32)
+        sol = np.empty(self.cols, dtype=np.int32)
+        self._reserve_trail()
+        links = (self.U, self.D, self.L, self.R, self.C, self.S)
+
+        depth, self.top = search(*links, cols, sol, self.trail, 0, self.top, False, stop)
+        while depth >= 0:
+            yield self.row[sol[:depth]]
+            depth, self.top = search(*links, cols, sol, self.trail, depth, self.top, True, stop)
+
+    def count_solutions(self) -> int:
+        """Returns the number of solutions of the exact cover problem.
+
+        It is the same search as ``solutions``, but the solutions are counted by ``count``
+        without going back to Python. With Numba this makes it much faster when there are
+        many of them; without it the kernels are interpreted, and ``AlgorithmX`` on a
+        ``DancingLinksMatrix`` is much faster. The matrix is restored at the end.
+        """
+        cols = np.empty(self.cols, dtype=np.int32)
+        sol = np.empty(self.cols, dtype=np.int32)
+        self._reserve_trail()
+        n, self.top = count(
+            self.U, self.D, self.L, self.R, self.C, self.S, cols, sol, self.trail, self.top
+        )
+        return n
+
+
+def warm_up() -> None:
+    """Compiles the kernels by solving a 1x1 matrix.
+
+    Numba compiles each kernel on its first call; call this before timing a search, or
+    before a latency-sensitive one, so that the first real solve does not pay for it.
+    """
+    arrays = DancingLinksArrays(1)
+    arrays.add_sparse_row([0])
+    for _ in arrays.solutions():
+        pass
+    arrays.count_solutions()
+
+
+@njit(cache=True)
+def cover(U, D, L, R, C, S, c, trail, top):
+    """Covers the column with header node ``c``.
+
+    The unlinked nodes are pushed on ``trail`` from ``top``, followed by their number.
+
+    Returns:
+        int: The new top of the trail.
+    """
+    L[R[c]] = L[c]
+    R[L[c]] = R[c]
+    # the size of a covered column does not change until it is uncovered
+    S[c] += INACTIVE
+
+    start = top
+    i = D[c]
+    while i != c:
+        j = R[i]
+        while j != i:
+            U[D[j]] = U[j]
+            D[U[j]] = D[j]
+            S[C[j]] -= 1
+            trail[top] = j
+            top += 1
+            j = R[j]
+        i = D[i]
+
+    trail[top] = top - start
+    return top + 1
+
+
+@njit(cache=True)
+def uncover(U, D, L, R, C, S, c, trail, top):
+    """Uncovers the column with header node ``c``, undoing the last ``cover``.
+
+    The nodes are relinked in reverse order, popping them from ``trail``.
+
+    Returns:
+        int: The new top of the trail.
+    """
+    top -= 1
+    start = top - trail[top]
+    while top > start:
+        top -= 1
+        j = trail[top]
+        S[C[j]] += 1
+        U[D[j]] = j
+        D[U[j]] = j
+
+    S[c] -= INACTIVE
+    L[R[c]] = c
+    R[L[c]] = c
+    return top
+
+
+@njit(cache=True)
+def min_column(R, S):
+    """Returns the first uncovered primary column with the minimum size, 0 if there is none.
+
+    The compiled scan stops at the first column with at most one 1: it is either a dead end or
+    a forced choice, and no column can be better than that. In the interpreter a single
+    ``argmin`` over the sizes is faster than the walk, as the other columns are offset by
+    ``INACTIVE``.
+    """
+    if not HAS_NUMBA:
+        c = np.argmin(S)
+        return c if S[c] < INACTIVE else 0
+
+    best = 0
+    c = R[0]
+    while c != 0:
+        if S[c] <= 1:
+            return c
+        if best == 0 or S[c] < S[best]:
+            best = c
+        c = R[c]
+    return best
+
+
+@njit(cache=True)
+def search(U, D, L, R, C, S, cols, sol, trail, depth, top, resume, stop):
+    """Runs the Algorithm X until the next solution is found.
+
+    The search is iterative and its whole state is kept in ``cols`` and ``sol``: ``cols[k]``
+    is the column chosen at level ``k`` and ``sol[k]`` the row node currently tried for it
+    (the header node itself before the first row).
+
+    Args:
+        U, D, L, R, C, S: The arrays of the matrix.
+        cols (np.ndarray): The chosen columns, one slot per level.
+        sol (np.ndarray): The chosen rows, one slot per level.
+        trail (np.ndarray): The trail of ``cover``.
+        depth (int): The number of levels in the state, 0 when starting.
+        top (int): The top of the trail.
+        resume (bool): False when starting, True to go on after a solution.
+        stop (np.ndarray): A one-item flag, the search is abandoned when it is not 0.
+
+    Returns:
+        tuple[int, int]: The depth of the solution found, whose row nodes are
+        ``sol[:depth]``, or -1 if there are no more solutions or the search was stopped; and
+        the new top of the trail.
+    """
+    while True:
+        if stop[0]:
+            return -1, top
+        if not resume:
+            if R[0] == 0:
+                # matrix is empty, solution found
+                return depth, top
+            c = min_column(R, S)
+            top = cover(U, D, L, R, C, S, c, trail, top)
+            cols[depth] = c
+            sol[depth] = c
+            depth += 1
+        resume = False
+
+        # move to the next row of the deepest column, backtracking from the
+        # columns that have no rows left
+        while depth > 0:
+            k = depth - 1
+            c = cols[k]
+            r = sol[k]
+
+            if r != c:
+                j = L[r]
+                while j != r:
+                    top = uncover(U, D, L, R, C, S, C[j], trail, top)
+                    j = L[j]
+
+            r = D[r]
+            if r != c:
+                sol[k] = r
+                j = R[r]
+                while j != r:
+                    top = cover(U, D, L, R, C, S, C[j], trail, top)
+                    j = R[j]
+                break
+
+            top = uncover(U, D, L, R, C, S, c, trail, top)
+            depth -= 1
+
+        if depth == 0:
+            return -1, top
+
+
+@njit(cache=True)
+def count(U, D, L, R, C, S, cols, sol, trail, top):
+    """Counts the solutions found by ``search``.
+
+    Returns:
+        tuple[int, int]: The number of solutions and the new top of the trail.
+    """
+    n = 0
+    stop = np.zeros(1, dtype=np.int8)
+    depth, top = search(U, D, L, R, C, S, cols, sol, trail, 0, top, False, stop)
+    while depth >= 0:
+        n += 1
+        depth, top = search(U, D, L, R, C, S, cols, sol, trail, depth, top, True, stop)
+    return n, top
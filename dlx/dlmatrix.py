@@ -7,13 +7,18 @@ See http://arxiv.org/abs/cs/0011047.
 from __future__ import annotations
 
 import random
-from collections.abc import Iterable
+from collections.abc import Iterable, Sequence
+from itertools import chain, repeat
+from operator import attrgetter
 from typing import Literal, Self
 
 import numpy as np
 
 __author__ = "Davide Canton"
 
+# sort key of the column headers, used to break ties in min_column
+_col_idx = attrgetter("col_idx")
+
 
 class CannotAddRowsError(Exception):
     """Exception raised if no rows can be added to the matrix."""
@@ -26,7 +31,8 @@ class EmptyDLMatrix(Exception):
 class Cell:
     """Inner cell.
 
-    It stores 4 pointers to neighbors, a pointer to the column header and the indexes associated.
+    It stores 4 pointers to neighbors, a pointer to the column header and the indexes of the
+    row and of the column of the cell (the row index is -1 for the column headers).
     """
 
     U: Self
@@ -34,39 +40,53 @@ class Cell:
     L: Self
     R: Self
     C: HeaderCell | None
-    indexes: tuple[int, int] | None
+    row_idx: int
+    col_idx: int
 
-    __slots__ = list("UDLRC") + ["indexes"]
+    __slots__ = ("U", "D", "L", "R", "C", "row_idx", "col_idx")
 
     def __init__(self) -> None:
         self.U = self.D = self.L = self.R = self
         self.C = None
-        self.indexes = None
+        self.row_idx = self.col_idx = -1
+
+    @classmethod
+    def alloc(cls, n: int) -> list[Self]:
+        """Allocates ``n`` cells, skipping ``__init__``.
+
+        Every slot of the returned cells is unset and must be assigned by the caller.
+        It is used when building the matrix, where all the links are overwritten anyway.
+        """
+        return list(map(cls.__new__, repeat(cls, n)))
 
     def __str__(self) -> str:
-        return f"Node: {self.indexes}"
+        return f"Node: {(self.row_idx, self.col_idx)}"
 
     def __repr__(self) -> str:
-        return f"Cell[{self.indexes}]"
+        return f"Cell[{(self.row_idx, self.col_idx)}]"
 
 
 class HeaderCell(Cell):
     """Column Header cell.
 
     This is a special cell that stores also a ``name`` and a ``size`` member.
+    ``primary`` is False for secondary columns, which are never chosen by the search.
+    ``active_index`` is the position of a primary column in ``DancingLinksMatrix.active_cols``.
     """
 
     size: int
     name: str
-    is_first: bool
+    primary: bool
+    active_index: int
 
-    __slots__ = ["size", "name", "is_first"]
+    __slots__ = ("size", "name", "primary", "active_index")
 
-    def __init__(self, name: str) -> None:
+    def __init__(self, name: str, primary: bool = True) -> None:
         super().__init__()
         self.size = 0
         self.name = name
-        self.is_first = False
+        self.primary = primary
+        self.active_index = -1
 
 
 class DancingLinksMatrix:
@@ -75,12 +95,24 @@ class DancingLinksMatrix:
     It stores a circular doubly linked list of 1s, and another list
     of column headers. Every cell points to its upper, lower, left and right
     neighbors in a circular fashion.
+
+    The uncovered primary columns are also kept in ``buckets``, indexed by
+    column size, so that the column with the minimum number of 1s can be found
+    without scanning the whole header list. The buckets are dicts used as
+    sets; ties are broken in favour of the column with the lowest index, as in a scan
+    of the header list, so that every search engine tries the same branches first.
+
+    ``active_cols`` lists the uncovered primary columns, so that a random one can be
+    picked in constant time.
     """
 
     header: HeaderCell
     rows: int
     cols: int
     col_list: list[HeaderCell] | None
+    row_heads: list[Cell]
+    buckets: list[dict[HeaderCell, None]]
+    active_cols: list[HeaderCell]
 
     def __init__(self, columns: int | Iterable[str]):
         """Creates a DL_Matrix.
@@ -97,33 +129,27 @@ class DancingLinksMatrix:
         :raises TypeError, if columns is not a number neither an iterable.
         """
         self.header = HeaderCell("<H>")
-        self.header.is_first = True
         self.rows = self.cols = 0
         self.col_list = []
+        self.row_heads = []
+        self.buckets = [{}]
+        self.active_cols = []
         self._create_column_headers(columns)
 
     def _create_column_headers(self, columns: int | Iterable[str | tuple[str, bool]]):
-        if isinstance(columns, int):
-            columns = int(columns)
-            column_names = (f"C{i}" for i in range(columns))
-        else:
-            column_names = columns
-
         prev = self.header
         # links every column in a for loop
-        for name in column_names:
-            if isinstance(name, tuple):
-                name, primary = name
-            else:
-                primary = True
-            cell = HeaderCell(name)
-            cell.indexes = (-1, self.cols)
-            cell.is_first = False
+        for name, primary in parse_columns(columns):
+            cell = HeaderCell(name, primary)
+            cell.col_idx = self.cols
             self.col_list.append(cell)
             if primary:
                 prev.R = cell
                 cell.L = prev
                 prev = cell
+                self.buckets[0][cell] = None
+                cell.active_index = len(self.active_cols)
+                self.active_cols.append(cell)
             self.cols += 1
 
         prev.R = self.header
@@ -154,7 +180,8 @@ class DancingLinksMatrix:
         cell = None
         for ind in row:
             cell = Cell()
-            cell.indexes = (self.rows, ind)
+            cell.row_idx = self.rows
+            cell.col_idx = int(ind)
 
             if prev:
                 prev.R = cell
@@ -171,13 +198,81 @@ class DancingLinksMatrix:
             col.U = cell
             cell.D = col
             cell.C = col
+            if col.primary:
+                self._move_to_bucket(col, col.size + 1)
             col.size += 1
             prev = cell
 
         start.L = cell
         cell.R = start
+        self.row_heads.append(start)
         self.rows += 1
 
+    def add_sparse_rows(self, rows: np.ndarray | Sequence[Sequence[int]], already_sorted=False):
+        """Adds several sparse rows to the matrix.
+
+        It is equivalent to calling ``add_sparse_row`` on every row, but the column
+        sizes are computed in one pass, so every column header is updated only once.
+        If called after end_add is executed, ``CannotAddRowsError`` is raised.
+
+        :param rows: a 2-D array-like with one row per line, or a sequence of rows of any
+                     length, each row in the format accepted by ``add_sparse_row``.
+        :param already_sorted: True if every row is already sorted,
+                               default is False. Use it for performance
+                               optimization.
+        :raises CannotAddRowsError if end_add was already called.
+        :raises ValueError if rows is not a sequence of rows, or a row is empty.
+        """
+        if self.col_list is None:
+            raise CannotAddRowsError()
+
+        cols, lengths = flatten_rows(rows)
+        if not len(lengths):
+            return
+        if not already_sorted:
+            row_ids = np.repeat(np.arange(len(lengths)), lengths)
+            cols = cols[np.lexsort((cols, row_ids))]
+
+        col_list = self.col_list
+        # every slot of the new cells is set below
+        cells = Cell.alloc(len(cols))
+        ends = np.cumsum(lengths).tolist()
+        start = 0
+        r = self.rows
+        inds = cols.tolist()
+        for end in ends:
+            self.row_heads.append(cells[start])
+            prev = cells[end - 1]
+            for k in range(start, end):
+                cell = cells[k]
+                ind = inds[k]
+                cell.row_idx = r
+                cell.col_idx = ind
+                cell.L = prev
+                prev.R = cell
+                prev = cell
+
+                col = col_list[ind]
+                last = col.U
+                last.D = cell
+                cell.U = last
+                col.U = cell
+                cell.D = col
+                cell.C = col
+            start = end
+            r += 1
+
+        # the sizes (and the buckets) are updated once per column
+        counts = np.bincount(cols, minlength=self.cols)
+        for ind in np.flatnonzero(counts).tolist():
+            col = col_list[ind]
+            size = col.size + int(counts[ind])
+            if col.primary:
+                self._move_to_bucket(col, size)
+            col.size = size
+
+        self.rows += len(lengths)
+
     def end_add(self) -> None:
         """Called when there are no more rows to be inserted.
 
@@ -185,23 +280,103 @@ class DancingLinksMatrix:
         """
         self.col_list = None
 
+    def release(self) -> None:
+        """Frees the cells of the matrix, which cannot be used afterwards.
+
+        The cells form reference cycles, so they would be freed only by the cyclic garbage
+        collector: this unlinks them, so that they are freed as soon as they are unreachable.
+        Use it when the matrix is no longer needed after converting it, e.g. with
+        ``DancingLinksArrays.from_matrix``.
+        """
+        header = self.header
+        cells: list[Cell] = [header]
+        col = header.R
+        while col is not header:
+            cells.append(col)
+            col = col.R
+        for start in self.row_heads:
+            cells.append(start)
+            j = start.R
+            while j is not start:
+                cells.append(j)
+                j = j.R
+        # the secondary columns are reachable only from their cells
+        cells.extend({cell.C for cell in cells[1:] if cell.C is not None})
+
+        for cell in cells:
+            cell.U = cell.D = cell.L = cell.R = cell.C = None
+        self.col_list = None
+        self.row_heads = []
+        self.buckets = [{}]
+        self.active_cols = []
+
+    def decode_solution(self, rows: Iterable[int]) -> dict[int, list[str]]:
+        """Returns the names of the columns of the 1s in every row of ``rows``.
+
+        :param rows: the indexes of the rows, e.g. a solution found by ``AlgorithmX``.
+        :return: A dict ``{row_index: list of column names}``.
+        """
+        sol = {}
+        for r in rows:
+            start = self.row_heads[r]
+            names = [start.C.name]
+            j = start.R
+            while j is not start:
+                names.append(j.C.name)
+                j = j.R
+            sol[r] = names
+        return sol
+
+    def bitsets(self) -> tuple[list[int], list[int], int]:
+        """Returns the 1s of the matrix as bitsets, stored in Python ints.
+
+        The matrix must not have covered columns.
+
+        :return: A tuple ``(row_cols, col_rows, primary)``: the bit ``c`` of ``row_cols[r]``
+                 and the bit ``r`` of ``col_rows[c]`` are set if the row ``r`` has a 1 in the
+                 column ``c``, and ``primary`` has the bits of the primary columns set.
+        """
+        row_cols = []
+        col_rows = [0] * self.cols
+        for r, start in enumerate(self.row_heads):
+            bit = 1 << r
+            mask = 0
+            j = start
+            while True:
+                c = j.col_idx
+                mask |= 1 << c
+                col_rows[c] |= bit
+                j = j.R
+                if j is start:
+                    break
+            row_cols.append(mask)
+
+        primary = 0
+        col = self.header.R
+        while col is not self.header:
+            primary |= 1 << col.col_idx
+            col = col.R
+        return row_cols, col_rows, primary
+
     def min_column(self) -> HeaderCell:
         """Returns the column header of the column with the minimum number of 1s.
 
         :return: A column header.
         :raises: EmptyDLMatrix if the matrix is empty.
         """
-        if self.header.R.is_first:
+        if self.header.R is self.header:
             raise EmptyDLMatrix()
 
-        col_min = self.header.R
-
-        col: HeaderCell
-        for col in iterate_cell(self.header, "R"):
-            if not col.is_first and col.size < col_min.size:
-                col_min = col
+        for bucket in self.buckets:
+            if bucket:
+                return min(bucket, key=_col_idx)
 
-        return col_min
+    def _move_to_bucket(self, col: HeaderCell, size: int) -> None:
+        buckets = self.buckets
+        while size >= len(buckets):
+            buckets.append({})
+        del buckets[col.size][col]
+        buckets[size][col] = None
 
     def random_column(self) -> HeaderCell:
         """Returns a random column header.
@@ -211,18 +386,11 @@ class DancingLinksMatrix:
         :return: A column header.
         :raises: EmptyDLMatrix if the matrix is empty.
         """
-        col = self.header.R
-        if col is self.header:
+        active_cols = self.active_cols
+        if not active_cols:
             raise EmptyDLMatrix()
 
-        n = random.randint(0, self.cols - 1)
-
-        for _ in range(n):
-            col = col.R
-
-        if col.is_first:
-            col = col.R
-        return col
+        return active_cols[random.randrange(len(active_cols))]
 
     def __str__(self):
         names = []
@@ -230,20 +398,18 @@ class DancingLinksMatrix:
         rows, cols = set(), []
 
         col: HeaderCell
-        for col in iterate_cell(self.header, "R"):
-            cols.append(col.indexes[1])
+        for col in _iter_R(self.header):
+            cols.append(col.col_idx)
             names.append(col.name)
 
-            for cell in iterate_cell(col, "D"):
-                ind = cell.indexes
-                rows.add(ind[0])
-                m[ind] = 1
+            for cell in _iter_D(col):
+                rows.add(cell.row_idx)
+                m[cell.row_idx, cell.col_idx] = 1
 
         m = m[list(rows)][:, cols]
         return "\n".join([", ".join(names), str(m)])
 
-    @staticmethod
-    def cover(col: HeaderCell) -> None:
+    def cover(self, col: HeaderCell) -> None:
         """Covers the column ``col``.
 
         It is done by removing the 1s in the column and also all
@@ -251,17 +417,41 @@ class DancingLinksMatrix:
 
         :param col: The column header of the column that has to be covered.
         """
-        col.R.L = col.L
-        col.L.R = col.R
-
-        for i in iterate_cell(col, "D"):
-            for j in iterate_cell(i, "R"):
-                j.D.U = j.U
-                j.U.D = j.D
-                j.C.size -= 1
-
-    @staticmethod
-    def uncover(c: HeaderCell) -> None:
+        buckets = self.buckets
+        left, right = col.L, col.R
+        right.L = left
+        left.R = right
+        if col.primary:
+            del buckets[col.size][col]
+            # swap-remove from the active columns, col keeps its index so that
+            # uncover can put it back in place
+            active_cols = self.active_cols
+            last = active_cols.pop()
+            if last is not col:
+                active_cols[col.active_index] = last
+                last.active_index = col.active_index
+
+        # the links are followed by hand instead of going through iterate_cell,
+        # this is the hottest loop of the whole search
+        i = col.D
+        while i is not col:
+            j = i.R
+            while j is not i:
+                up, down = j.U, j.D
+                down.U = up
+                up.D = down
+                h = j.C
+                size = h.size - 1
+                h.size = size
+                if h.primary:
+                    # cells of covered columns are never reached here, so h is
+                    # always in its bucket
+                    del buckets[size + 1][h]
+                    buckets[size][h] = None
+                j = j.R
+            i = i.D
+
+    def uncover(self, c: HeaderCell) -> None:
         """Uncovers the column c.
 
         It is done by re-adding the 1s in the column and also all
@@ -269,19 +459,102 @@ class DancingLinksMatrix:
 
         :param c: The column header of the column that has to be uncovered.
         """
-        for i in iterate_cell(c, "U"):
-            for j in iterate_cell(i, "L"):
-                j.C.size += 1
+        buckets = self.buckets
+        i = c.U
+        while i is not c:
+            j = i.L
+            while j is not i:
+                h = j.C
+                size = h.size + 1
+                h.size = size
+                if h.primary:
+                    del buckets[size - 1][h]
+                    buckets[size][h] = None
                 j.D.U = j.U.D = j
+                j = j.L
+            i = i.U
 
         c.R.L = c.L.R = c
+        if c.primary:
+            buckets[c.size][c] = None
+            # columns are uncovered in reverse order, so the column that took the
+            # place of c is the one that was last when c was covered
+            active_cols = self.active_cols
+            if c.active_index < len(active_cols):
+                moved = active_cols[c.active_index]
+                moved.active_index = len(active_cols)
+                active_cols.append(moved)
+                active_cols[c.active_index] = c
+            else:
+                active_cols.append(c)
 
 
-def iterate_cell(cell: Cell, direction: Literal["U", "D", "L", "R"]) -> Iterable[Cell]:
-    cur: Cell = getattr(cell, direction)
+def flatten_rows(rows: np.ndarray | Sequence[Sequence[int]]) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the column indexes of the 1s of all the rows, one row after the other, and the
+    number of 1s of every row.
+
+    :param rows: a 2-D array-like with one row per line, or a sequence of rows of any length.
+    :raises ValueError if rows is not a sequence of rows, or a row is empty.
+    """
+    if isinstance(rows, np.ndarray) and rows.ndim == 2:
+        lengths = np.full(len(rows), rows.shape[1], dtype=np.intp)
+        cols = rows.astype(np.intp).ravel()
+    elif isinstance(rows, np.ndarray) and rows.dtype != object:
+        raise ValueError(f"expected a 2-D array of rows, got {rows.ndim} dimensions")
+    else:
+        try:
+            lengths = np.fromiter(map(len, rows), dtype=np.intp, count=len(rows))
+        except TypeError:
+            raise ValueError("expected a sequence of rows of indexes") from None
+        cols = np.fromiter(chain.from_iterable(rows), dtype=np.intp, count=lengths.sum())
+    if len(lengths) and not lengths.all():
+        raise ValueError("every row must have at least one 1")
+    return cols, lengths
+
+
+def parse_columns(
+    columns: int | Iterable[str | tuple[str, bool]],
+) -> Iterable[tuple[str, bool]]:
+    """Yields the pairs (name, primary) of the columns, as described in DancingLinksMatrix."""
+    if isinstance(columns, int):
+        return ((f"C{i}", True) for i in range(columns))
+    return (name if isinstance(name, tuple) else (name, True) for name in columns)
+
+
+def _iter_U(cell: Cell) -> Iterable[Cell]:
+    cur = cell.U
+    while cur is not cell:
+        yield cur
+        cur = cur.U
+
+
+def _iter_D(cell: Cell) -> Iterable[Cell]:
+    cur = cell.D
+    while cur is not cell:
+        yield cur
+        cur = cur.D
+
+
+def _iter_L(cell: Cell) -> Iterable[Cell]:
+    cur = cell.L
+    while cur is not cell:
+        yield cur
+        cur = cur.L
+
+
+def _iter_R(cell: Cell) -> Iterable[Cell]:
+    cur = cell.R
     while cur is not cell:
         yield cur
-        cur = getattr(cur, direction)
+        cur = cur.R
+
+
+# one generator per direction, so that no attribute is looked up by name while iterating
+_ITERS = {"U": _iter_U, "D": _iter_D, "L": _iter_L, "R": _iter_R}
+
+
+def iterate_cell(cell: Cell, direction: Literal["U", "D", "L", "R"]) -> Iterable[Cell]:
+    return _ITERS[direction](cell)
 
 
 # TODO to be completed
@@ -289,15 +562,15 @@ class MatrixDisplayer:
     def __init__(self, matrix):
         dic = {}
 
-        for col in iterate_cell(matrix.header, "R"):
-            dic[col.indexes] = col
+        for col in _iter_R(matrix.header):
+            dic[col.row_idx, col.col_idx] = col
 
-        for col in iterate_cell(matrix.header, "R"):
+        for col in _iter_R(matrix.header):
             first = col.D
-            dic[first.indexes] = first
-            for cell in iterate_cell(first, "D"):
+            dic[first.row_idx, first.col_idx] = first
+            for cell in _iter_D(first):
                 if cell is not col:
-                    dic[cell.indexes] = cell
+                    dic[cell.row_idx, cell.col_idx] = cell
 
         self.dic = dic
         self.rows = matrix.rows
@@ -321,18 +594,19 @@ class MatrixDisplayer:
             print()
 
 
-def _from_dense(row):
+def from_dense(row: Iterable) -> list[int]:
+    """Returns the indexes of the 1s of a dense row, in the format of ``add_sparse_row``."""
     return [i for i, el in enumerate(row) if el]
 
 
 if __name__ == "__main__":
     r = [
-        _from_dense([1, 0, 0, 1, 0, 0, 1]),
-        _from_dense([1, 0, 0, 1, 0, 0, 0]),
-        _from_dense([0, 0, 0, 1, 1, 0, 1]),
-        _from_dense([0, 0, 1, 0, 1, 1, 0]),
-        _from_dense([0, 1, 1, 0, 0, 1, 1]),
-        _from_dense([0, 1, 0, 0, 0, 0, 1]),
+        from_dense([1, 0, 0, 1, 0, 0, 1]),
+        from_dense([1, 0, 0, 1, 0, 0, 0]),
+        from_dense([0, 0, 0, 1, 1, 0, 1]),
+        from_dense([0, 0, 1, 0, 1, 1, 0]),
+        from_dense([0, 1, 1, 0, 0, 1, 1]),
+        from_dense([0, 1, 0, 0, 0, 0, 1]),
     ]
 
     d = DancingLinksMatrix("1234567")
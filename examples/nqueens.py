@@ -3,9 +3,13 @@
 from pathlib import Path  # noqa: I001
 import sys
 
+import numpy as np
+
 sys.path.append(str(Path(__file__).parent.parent.resolve()))
 
-from dlx import AlgorithmX, DancingLinksMatrix
+from dlx import AlgorithmX, DancingLinksArrays, DancingLinksMatrix
+from dlx.alg_x import BITSET_MAX_ROWS
+from dlx.dlarrays import HAS_NUMBA
 
 __author__ = "Davide Canton"
 
@@ -31,20 +35,31 @@ def compute_row(i, j, n):
     return [i, n + j, 2 * n + i + j, 5 * n - 2 - i + j]
 
 
+def compute_rows(n):
+    """Computes the rows of all the cells, in (i, j) order."""
+    i, j = np.divmod(np.arange(n * n), n)
+    return np.stack(compute_row(i, j, n), axis=1)
+
+
 class PrintFirstSol:
     """Callable that prints the first solution."""
 
+    __slots__ = ("size",)
+
     def __init__(self, size):
         """Init."""
         self.size = size
 
     def __call__(self, sol):
-        """Prints the solution."""
+        """Prints the solution.
+
+        The rows are added in (i, j) order, so the row index of the queen in (i, j) is
+        ``i * size + j``.
+        """
         pos = [0] * self.size
 
-        for v in sol.values():
-            v.sort()
-            c, r = map(int, [v[2][1:], v[3][1:]])
+        for row in sol:
+            r, c = divmod(row, self.size)
             pos[r] = c
 
         for i in range(self.size):
@@ -68,22 +83,52 @@ def print_solution_count():
     return inner
 
 
+class CountSolutions:
+    """Callable that counts the solutions."""
+
+    __slots__ = ("count",)
+
+    def __init__(self):
+        """Init."""
+        self.count = 0
+
+    def __call__(self, _sol):
+        """Count solutions."""
+        self.count += 1
+
+
 def main():
-    """Main solver."""
+    """Main solver.
+
+    With a second argument, all the solutions are counted and the count is printed: with 1
+    the search is serial, with more the rows of the first chosen column are searched in that
+    many worker processes. Without Numba the workers search on bitsets, which hold at most
+    ``BITSET_MAX_ROWS`` rows, so larger boards are counted serially. Otherwise the first
+    solution is printed.
+    """
     size = int(sys.argv[1])
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 0
 
-    d = DancingLinksMatrix(get_names(size))
-
-    for i in range(size):
-        for j in range(size):
-            row = compute_row(i, j, size)
-            d.add_sparse_row(row, already_sorted=True)
+    # with Numba the search runs on the arrays anyway, so the cells are not built at all
+    d = (DancingLinksArrays if HAS_NUMBA else DancingLinksMatrix)(get_names(size))
 
+    d.add_sparse_rows(compute_rows(size), already_sorted=True)
     d.end_add()
 
-    p = PrintFirstSol(size)
-    alg = AlgorithmX(d, p)
-    alg()
+    if not HAS_NUMBA and d.rows > BITSET_MAX_ROWS:
+        processes = min(processes, 1)
+
+    if processes == 1 and HAS_NUMBA:
+        # the compiled kernels count without calling back into Python
+        print(d.count_solutions())
+    elif processes:
+        counter = CountSolutions()
+        AlgorithmX(d, counter, processes=processes if processes > 1 else 0)()
+        print(counter.count)
+    else:
+        p = PrintFirstSol(size)
+        alg = AlgorithmX(d, p)
+        alg()
 
 
 if __name__ == "__main__":
@@ -1,18 +1,22 @@
 """Sudoku Solver using Dancing Links."""
 
 import itertools as it
+import sys
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
 import numpy as np
 
-from dlx import AlgorithmX, DancingLinksMatrix
+from dlx import AlgorithmX, DancingLinksArrays, DancingLinksMatrix
+from dlx.dlarrays import HAS_NUMBA
 
 from .sudoku_board import SudokuBoard
 
 __author__ = "Davide Canton"
 
 
-def column_names():
-    """Yields the column names."""
+def _column_names():
     # 81, RiCj = j + 9i
     for i, j in it.product(range(1, 10), repeat=2):
         yield f"R{i}C{j}"
@@ -27,6 +31,15 @@ def column_names():
         yield f"B{i}#{j}"
 
 
+# the names are the same for every matrix, so they are formatted only once
+_COLUMN_NAMES = tuple(_column_names())
+
+
+def column_names():
+    """Returns the column names."""
+    return _COLUMN_NAMES
+
+
 def get_square_index(i: int, j: int):
     """Returns the square index."""
     i, j = i // 3, j // 3
@@ -34,10 +47,11 @@ def get_square_index(i: int, j: int):
 
 
 def compute_row(i: int, j: int, v: int):
-    """Computes the row indexes."""
-    i -= 1
-    j -= 1
-    v -= 1
+    """Computes the row indexes.
+
+    It works also element-wise on ndarrays of indexes.
+    """
+    i, j, v = i - 1, j - 1, v - 1
     i1 = j + 9 * i
     i2 = 81 + v + 9 * i
     i3 = 81 * 2 + v + 9 * j
@@ -45,25 +59,46 @@ def compute_row(i: int, j: int, v: int):
     return [i1, i2, i3, i4]
 
 
+# the rows of all the 729 tags, see row_tags
+_ROW_TABLE = np.stack(compute_row(*np.indices((9, 9, 9)).reshape(3, -1) + 1), axis=1)
+
+
+def row_tags(known: dict[tuple[int, int], int]) -> np.ndarray:
+    """Returns the tags of the admissible rows, given the known cells, in increasing order.
+
+    The tag of the row that puts v in the cell (i, j) is ``81 * (i - 1) + 9 * (j - 1) + v - 1``.
+    """
+    # the value of the cell of every tag, 0 if unknown
+    cell = to_np(known).repeat(9)
+    v = np.tile(np.arange(1, 10, dtype=np.uint8), 81)
+    # a known cell admits only its value
+    return np.flatnonzero((cell == 0) | (cell == v))
+
+
+def compute_rows(tags: np.ndarray) -> np.ndarray:
+    """Computes the rows of the given tags."""
+    return _ROW_TABLE[tags]
+
+
 class GetFirstSol:
     """Callable that returns the first solution."""
 
-    def __init__(self):
-        """Init."""
+    __slots__ = ("tags", "sol")
+
+    def __init__(self, tags: np.ndarray):
+        """Init.
+
+        Args:
+            tags (np.ndarray): The tags of the rows of the matrix, see ``row_tags``.
+        """
+        self.tags = tags
         self.sol = None
 
     def __call__(self, sol):
         """Returns the solved matrix."""
         matrix = np.zeros((9, 9), dtype=np.uint8)
-
-        for v in sol.values():
-            i, j, val = 0, 0, 0
-            for el in v:
-                if el[2] == "#":
-                    val = int(el[3])
-                else:
-                    i, j = map(int, [el[1], el[3]])
-            matrix[i - 1, j - 1] = val
+        i, j, v = np.unravel_index(self.tags[sol], (9, 9, 9))
+        matrix[i, j] = v + 1
 
         self.sol = matrix
         return True
@@ -72,6 +107,8 @@ class GetFirstSol:
 class CountSolutions:
     """Callable that counts the solutions."""
 
+    __slots__ = ("count",)
+
     def __init__(self):
         """Init."""
         self.count = 0
@@ -83,15 +120,14 @@ class CountSolutions:
 
 def read_from_file(file_path) -> dict[tuple[int, int], int]:
     """Reads a sudoku matrix from a file."""
-    known = {}
-    with open(file_path) as f_in:
-        for i, line in enumerate(f_in, start=1):
-            for j, char in enumerate(line.rstrip(), start=1):
-                try:
-                    known[i, j] = int(char)
-                except ValueError:
-                    pass
-    return known
+    # one line per row, every character other than 1..9 is an empty cell
+    lines = Path(file_path).read_bytes().splitlines()[:9]
+    text = b"".join(line[:9].ljust(9) for line in lines)
+    digits = np.frombuffer(text, dtype=np.uint8).reshape(-1, 9) - ord("0")
+    # characters below "0" wrap around to large values
+    i, j = np.nonzero((digits >= 1) & (digits <= 9))
+    positions = zip((i + 1).tolist(), (j + 1).tolist(), strict=True)
+    return dict(zip(positions, digits[i, j].tolist(), strict=True))
 
 
 def to_np(known):
@@ -104,38 +140,67 @@ def to_np(known):
     return matrix
 
 
-def main():
-    """Main solver."""
-    matrix = DancingLinksMatrix(column_names())
+def solve(known: dict[tuple[int, int], int]) -> np.ndarray | None:
+    """Returns the first solution of the puzzle with the given known cells, None if unsolvable."""
+    # with Numba the search runs on the arrays anyway, so the cells are not built at all
+    matrix = (DancingLinksArrays if HAS_NUMBA else DancingLinksMatrix)(column_names())
 
-    known = read_from_file("./initial_board.txt")
-    # starting_board = SudokuBoard(to_np(known))
-    # print(starting_board)
+    tags = row_tags(known)
+    matrix.add_sparse_rows(compute_rows(tags), already_sorted=True)
+    matrix.end_add()
 
-    for i, j in it.product(range(1, 10), repeat=2):
-        if (i, j) in known:
-            row = compute_row(i, j, known[i, j])
-            matrix.add_sparse_row(row, already_sorted=True)
-        else:
-            for v in range(1, 10):
-                row = compute_row(i, j, v)
-                matrix.add_sparse_row(row, already_sorted=True)
+    sol = GetFirstSol(tags)
+    AlgorithmX(matrix, sol)()
+    return sol.sol
+
+
+def solve_batch(
+    puzzles: Iterable[dict[tuple[int, int], int]], processes: int | None = None
+) -> list[np.ndarray | None]:
+    """Solves several puzzles in parallel, each one by a worker process.
+
+    Args:
+        puzzles (Iterable[dict[tuple[int, int], int]]): The known cells of every puzzle.
+        processes (int | None): The number of worker processes, the number of CPUs if None.
 
+    Returns:
+        list[np.ndarray | None]: The solution of every puzzle, in order, as returned by ``solve``.
+    """
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(solve, puzzles))
+
+
+def count_solutions(known: dict[tuple[int, int], int]) -> int:
+    """Returns the number of solutions of the puzzle with the given known cells."""
+    # with Numba the search runs on the arrays anyway, so the cells are not built at all
+    matrix = (DancingLinksArrays if HAS_NUMBA else DancingLinksMatrix)(column_names())
+    matrix.add_sparse_rows(compute_rows(row_tags(known)), already_sorted=True)
     matrix.end_add()
 
-    # sol = CountSolutions()
-    sol = GetFirstSol()
+    if HAS_NUMBA:
+        # the compiled kernels count without calling back into Python
+        return matrix.count_solutions()
+    counter = CountSolutions()
+    AlgorithmX(matrix, counter)()
+    return counter.count
+
+
+def main():
+    """Main solver.
+
+    With the ``count`` argument the solutions are counted, otherwise the first one is printed.
+    """
+    known = read_from_file("./initial_board.txt")
+    # starting_board = SudokuBoard(to_np(known))
+    # print(starting_board)
 
-    try:
-        alg = AlgorithmX(matrix, sol)
-        alg()
+    if sys.argv[1:] == ["count"]:
+        print(count_solutions(known))
+        return
 
-        board = SudokuBoard(sol.sol)
-        print(board)
-        print(board.valid())
-    finally:
-        # print(sol.count)
-        pass
+    board = SudokuBoard(solve(known), copy=False)
+    print(board)
+    print(board.valid())
 
 
 if __name__ == "__main__":
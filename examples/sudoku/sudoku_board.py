@@ -1,27 +1,41 @@
 """Sudoku Board implementation."""
 
 import numpy as np
-from numpy.lib.stride_tricks import as_strided
 
 __author__ = "Davide Canton"
 
+# bits 1..9 set
+_FULL_MASK = 0x3FE
+# bit of every uint8 cell value, a lookup is cheaper than a shift; values other than 1..9
+# set bit 0, as an empty cell
+_BIT = np.ones(256, dtype=np.uint16)
+_BIT[1:10] <<= np.arange(1, 10, dtype=np.uint16)
+# character of every uint8 cell value, "?" for the values above 9
+_DIGITS = np.frombuffer(b" 123456789".ljust(256, b"?"), dtype=np.uint8)
+
 
 class SudokuBoard:
     """Sudoku Board."""
 
-    def __init__(self, m=None):
+    __slots__ = ("_board", "squares")
+
+    def __init__(self, m=None, copy=True):
         """Creates a board.
 
-        If ``m`` is not None, it is copied.
+        If ``m`` is not None, it is copied unless ``copy`` is False.
 
         Args:
             m (np.ndarray | list[list] | None): a ndarray or a list of lists.
+            copy (bool): If False and ``m`` is already a C-contiguous ``uint8`` ndarray, the
+                board is a view of ``m`` instead of a copy.
         """
-        if m is not None:
+        if m is not None and not copy:
+            self._board = np.ascontiguousarray(m, dtype=np.uint8)
+        elif m is not None:
             self._board = np.array(m, dtype=np.uint8)
         else:
             self._board = np.zeros((9, 9), dtype=np.uint8)
-        self.squares = as_strided(self._board, shape=(3, 3, 3, 3), strides=(27, 3, 9, 1))
+        self.squares = self._board.reshape(3, 3, 3, 3).swapaxes(1, 2)
 
     @property
     def all_filled(self) -> bool:
@@ -69,7 +83,8 @@ class SudokuBoard:
             raise ValueError("Invalid position")
 
     def _valid_position(self, pos):
-        return all(0 <= i <= 8 for i in pos)
+        i, j = pos
+        return 0 <= i <= 8 and 0 <= j <= 8
 
     def valid(self):
         """Returns True if the board is a valid Sudoku.
@@ -77,28 +92,18 @@ class SudokuBoard:
         Returns:
             bool: True if the board is a valid Sudoku, False else.
         """
-        for i in range(9):
-            u = np.unique(self._board[i, :])
-            if u.shape[0] < 9 or np.count_nonzero(u) < 9:
-                return False
-            u = np.unique(self._board[:, i])
-            if u.shape[0] < 9 or np.count_nonzero(u) < 9:
-                return False
-            u = np.unique(self.squares[divmod(i, 3)])
-            if u.shape[0] < 9 or np.count_nonzero(u) < 9:
-                return False
-        return True
+        # every digit sets its own bit, a group is valid iff bits 1..9 are all set;
+        # an empty cell sets bit 0, so incomplete groups never match
+        masks = _BIT[self._board]
+        rows = np.bitwise_or.reduce(masks, axis=1)
+        cols = np.bitwise_or.reduce(masks, axis=0)
+        squares = np.bitwise_or.reduce(masks.reshape(3, 3, 3, 3), axis=(1, 3))
+        return all(bool((group == _FULL_MASK).all()) for group in (rows, cols, squares))
 
     def __str__(self):
         """Returns a stringified representation of the board."""
-        rows = []
-        for i in range(9):
-            row = []
-            for j in range(9):
-                el = self._board[i, j]
-                if el:
-                    row.append(str(el))
-                else:
-                    row.append(" ")
-            rows.append("|".join(row))
-        return "\n".join(rows)
+        # every row is 9 characters separated by "|", followed by a newline
+        text = np.full((9, 18), ord("|"), dtype=np.uint8)
+        text[:, 0:17:2] = _DIGITS[self._board]
+        text[:, 17] = ord("\n")
+        return text.tobytes()[:-1].decode()